@@ -21,10 +21,17 @@ Version: 4.0 - Marketplace Edition
 # ============================================================================
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
-from supabase import create_client, Client
+import numpy as np
+import json
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.errors import StreamlitAPIException
+from supabase import create_client, Client, ClientOptions
+# plotly is imported inside the chart builders / Payments page, so sessions that
+# never draw a chart (e.g. Live Queue only) skip its import cost on cold start
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -60,22 +67,6 @@ st.markdown("""
     .stTabs [data-baseweb="tab"] {
         padding: 10px 20px;
     }
-    .provider-badge {
-        display: inline-block;
-        padding: 5px 10px;
-        border-radius: 15px;
-        font-size: 12px;
-        font-weight: bold;
-        margin: 5px 0;
-    }
-    .doctor-badge {
-        background-color: #e3f2fd;
-        color: #1976d2;
-    }
-    .pharmacist-badge {
-        background-color: #f3e5f5;
-        color: #7b1fa2;
-    }
     </style>
 """, unsafe_allow_html=True)
 
@@ -85,11 +76,17 @@ st.markdown("""
 
 @st.cache_resource
 def init_supabase():
-    """Initialize connection to Supabase database"""
+    """
+    Initialize connection to Supabase database
+    
+    Cached as a resource, so every session and rerun shares one client and its
+    keep-alive connection pool. The PostgREST timeout is lowered from the 120s
+    default so a stalled request fails fast instead of hanging the page.
+    """
     try:
         url = st.secrets["supabase"]["url"]
         key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
+        return create_client(url, key, options=ClientOptions(postgrest_client_timeout=10))
     except Exception as e:
         st.error(f"Failed to connect to Supabase: {str(e)}")
         st.stop()
@@ -101,23 +98,94 @@ supabase = init_supabase()
 # DATABASE QUERY FUNCTIONS
 # ============================================================================
 
-def get_consultations():
-    """Fetch active consultations (not completed)"""
+# Column projections: each page only pulls the fields it renders
+LIVE_QUEUE_COLUMNS = (
+    'id,patient_name,patient_phone,symptoms,severity,duration,priority,status,'
+    'created_at,detected_keywords,provider_type,doctor_id,pharmacist_id,'
+    'ai_diagnosis,ai_drug_recommendations,pharmacist_diagnosis,pharmacist_prescription'
+)
+ANALYTICS_COLUMNS = (
+    'id,priority,status,severity,provider_type,created_at,response_time,'
+    'ai_diagnosis,pharmacist_diagnosis,diagnosis_agreement'
+)
+CONSULTATION_EXPORT_COLUMNS = LIVE_QUEUE_COLUMNS + (
+    ',pharmacist_response,diagnosis_agreement,consultation_fee,platform_revenue,'
+    'pharmacist_payout,started_at,completed_at,response_time'
+)
+PAYMENTS_COLUMNS = 'id,patient_name,status,provider_type,consultation_fee,platform_revenue,created_at'
+
+@st.cache_data(ttl=15, show_spinner=False)
+def get_consultations(limit=10, offset=0, priority=None, status=None, provider=None,
+                      open_only=False, refresh_tick=None):
+    """
+    Fetch one page of the live queue, most urgent (then longest waiting) first
+    
+    Filtering and paging run in Postgres so only the rendered rows are sent.
+    open_only drops finished sessions (completed_at set). refresh_tick is only
+    part of the cache key: the auto-refresh passes a new value each interval.
+    Returns (rows, total) where total is the number of rows matching the
+    filters, taken from the same request via count='exact'.
+    """
     try:
-        response = (supabase.table('Consultations')
-            .select('*')
-            .order('created_at', desc=True)
+        query = supabase.table('Consultations').select(LIVE_QUEUE_COLUMNS, count='exact')
+        
+        if priority:
+            query = query.eq('priority', priority)
+        if status:
+            query = query.ilike('status', status)
+        if provider == 'unassigned':
+            query = query.is_('doctor_id', 'null').is_('pharmacist_id', 'null')
+        elif provider:
+            query = query.ilike('provider_type', provider)
+        if open_only:
+            query = query.is_('completed_at', 'null')
+        
+        # URGENT > MODERATE > LOW also holds alphabetically, so desc puts urgent first;
+        # Postgres sorts NULLs first under DESC, so unprioritised rows are pushed last.
+        # Within a priority the longest-waiting patient comes first. The
+        # (priority, created_at) index can serve the sort (see DEPLOYMENT NOTES)
+        response = (query
+            .order('priority', desc=True, nullsfirst=False)
+            .order('created_at')
+            .range(offset, offset + limit - 1)
             .execute())
-        return response.data if response.data else []
+        return (response.data or []), (response.count or 0)
     except Exception as e:
         st.error(f"Error fetching consultations: {str(e)}")
-        return []
+        return [], 0
+
+@st.cache_data(ttl=15, show_spinner=False)
+def get_queue_summary(since, refresh_tick=None):
+    """
+    Count the open sessions behind the Live Queue metrics: (total, urgent, created since `since`)
+    
+    Like the default queue view, finished sessions (completed_at set) are left out,
+    and refresh_tick works as in get_consultations.
+    Each figure is a count-only request (count='exact', one id returned), so the
+    payload stays constant as history grows and isn't capped by PostgREST's max-rows.
+    """
+    def count_rows(apply_filter=lambda query: query):
+        query = (supabase.table('Consultations')
+            .select('id', count='exact')
+            .is_('completed_at', 'null'))
+        return apply_filter(query).limit(1).execute().count or 0
+    
+    try:
+        return tuple(fetch_concurrently(
+            count_rows,
+            lambda: count_rows(lambda query: query.eq('priority', 'URGENT')),
+            lambda: count_rows(lambda query: query.gte('created_at', since))
+        ))
+    except Exception as e:
+        st.error(f"Error fetching queue summary: {str(e)}")
+        return 0, 0, 0
 
-def get_all_consultations():
-    """Fetch ALL consultations for analytics"""
+@st.cache_data(ttl=30, show_spinner=False)
+def get_all_consultations(columns='*'):
+    """Fetch ALL consultations for analytics (optionally only the given columns)"""
     try:
         response = (supabase.table('Consultations')
-            .select('*')
+            .select(columns)
             .order('created_at', desc=True)
             .execute())
         return response.data if response.data else []
@@ -125,6 +193,7 @@ def get_all_consultations():
         st.error(f"Error fetching all consultations: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_doctors():
     """Fetch all doctors from database"""
     try:
@@ -137,6 +206,7 @@ def get_doctors():
         st.error(f"Error fetching doctors: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_pharmacists():
     """Fetch all pharmacists from database"""
     try:
@@ -149,6 +219,7 @@ def get_pharmacists():
         st.error(f"Error fetching pharmacists: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_pharmacies():
     """Fetch all pharmacies from database"""
     try:
@@ -161,6 +232,7 @@ def get_pharmacies():
         st.error(f"Error fetching pharmacies: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_users():
     """Fetch all patients/users"""
     try:
@@ -173,6 +245,7 @@ def get_users():
         st.error(f"Error fetching users: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_orders():
     """Fetch medication orders"""
     try:
@@ -185,6 +258,7 @@ def get_orders():
         st.error(f"Error fetching orders: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_payments():
     """Fetch payment records"""
     try:
@@ -197,6 +271,42 @@ def get_payments():
         st.error(f"Error fetching payments: {str(e)}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
+def get_analytics_df():
+    """
+    Analytics consultations as a DataFrame with the derived columns precomputed
+    
+    Timestamps are parsed once here (not per rerun), giving created_dt, date and
+    response_mins; low-cardinality text columns are categoricals.
+    """
+    df = pd.DataFrame(get_all_consultations(ANALYTICS_COLUMNS))
+    if df.empty:
+        return df
+    
+    # Low-cardinality text columns as categoricals: counts and masks run on int codes
+    if 'priority' in df.columns:
+        df['priority'] = df['priority'].astype(PRIORITY_DTYPE)
+    for col in ['status', 'severity']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
+    if 'created_at' in df.columns:
+        # utc=True: older rows have naive response_time values written by the
+        # dashboard while created_at carries an offset, and naive/aware
+        # timestamps can't be subtracted
+        df['created_dt'] = pd.to_datetime(df['created_at'], utc=True, format='ISO8601', errors='coerce')
+        df['date'] = df['created_dt'].dt.date
+        df['response_mins'] = np.nan
+        if 'response_time' in df.columns:
+            # Only parse the rows that have a response, and subtract once
+            responded = df['response_time'].notna()
+            df.loc[responded, 'response_mins'] = (
+                pd.to_datetime(df.loc[responded, 'response_time'], utc=True, format='ISO8601', errors='coerce')
+                - df.loc[responded, 'created_dt']
+            ).dt.total_seconds().div(60)
+    return df
+
+@st.cache_data(ttl=30, show_spinner=False)
 def get_inventory():
     """Fetch all medications from database"""
     try:
@@ -208,22 +318,168 @@ def get_inventory():
         st.error(f"Error fetching inventory: {str(e)}")
         return []
 
-def update_consultation_status(consultation_id, updates):
-    """Update a consultation record"""
-    try:
-        response = (supabase.table('Consultations')
+@st.cache_data(ttl=30, show_spinner=False)
+def get_inventory_df():
+    """
+    Inventory as a DataFrame with the derived columns precomputed
+    
+    Adds status (when the table doesn't store one), total_value, an _is_low flag
+    and a lowercase name column for search, so reruns don't recompute them.
+    """
+    df_inv = pd.DataFrame(get_inventory())
+    if df_inv.empty:
+        return df_inv
+    
+    # Derive stock status when the medications table doesn't store one
+    if 'status' not in df_inv.columns and 'current_stock' in df_inv.columns and 'reorder_point' in df_inv.columns:
+        df_inv['status'] = np.where(df_inv['current_stock'] <= df_inv['reorder_point'], 'Low Stock', 'OK')
+    
+    # Per-item stock value, computed once for the metric and the value chart.
+    # Explicit float64 keeps it on the numpy path if prices arrive as Decimals/strings.
+    if 'current_stock' in df_inv.columns and 'unit_price' in df_inv.columns:
+        df_inv['total_value'] = (df_inv['current_stock'].astype('float64')
+                                 * df_inv['unit_price'].astype('float64'))
+    
+    # Low-stock flag shared by the metric, the card view and the reorder helper
+    if 'status' in df_inv.columns:
+        df_inv['_is_low'] = df_inv['status'].eq('Low Stock')
+    
+    # Lowercased once so search is a plain substring scan per keystroke
+    if 'medication_name' in df_inv.columns:
+        df_inv['_name_lower'] = df_inv['medication_name'].str.lower()
+    return df_inv
+
+@st.cache_data(ttl=30, show_spinner=False)
+def export_consultations_csv():
+    """All consultations (export columns only) as UTF-8 CSV bytes (b'' when there are none)"""
+    consultations = get_all_consultations(CONSULTATION_EXPORT_COLUMNS)
+    return pd.DataFrame(consultations).to_csv(index=False).encode('utf-8') if consultations else b''
+
+@st.cache_data(ttl=30, show_spinner=False)
+def export_inventory_csv():
+    """All medications as UTF-8 CSV bytes (b'' when there are none)"""
+    inventory = get_inventory()
+    return pd.DataFrame(inventory).to_csv(index=False).encode('utf-8') if inventory else b''
+
+def fetch_concurrently(*fetchers):
+    """
+    Run independent fetch functions in parallel and return their results in order
+    
+    Each Supabase query is a blocking HTTPS round-trip, so pages that need
+    several tables wait for the slowest one instead of the sum of all of them.
+    Worker threads get the script context so st.error/st.cache_data still work.
+    """
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=len(fetchers),
+                            initializer=add_script_run_ctx,
+                            initargs=(None, ctx)) as pool:
+        futures = [pool.submit(fetch) for fetch in fetchers]
+        return [future.result() for future in futures]
+
+@st.cache_resource
+def get_write_executor():
+    """Shared thread pool for Supabase writes that shouldn't block the script thread"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def write_consultation_update(consultation_id, updates):
+    """Single-row update run on the write executor; raises instead of calling st.error"""
+    return (supabase.table('Consultations')
+        .update(updates)
+        .eq('id', consultation_id)
+        .execute())
+
+def collect_background_writes(consultation_id=None):
+    """
+    Settle finished background writes, optionally only those for one consultation
+    
+    A failed write is reported with st.error naming the patient, and its
+    optimistic card override and pending "Saving…" message are dropped; any
+    finished write invalidates the cached reads. Returns the ids whose writes
+    are still in flight.
+    """
+    pending_writes = st.session_state.get('_background_writes', [])
+    overrides = st.session_state.get('_card_rows', {})
+    messages = st.session_state.get('_card_messages', {})
+    still_running, in_flight, settled = [], set(), False
+    
+    for future, write_id, patient_name in pending_writes:
+        if not future.done() or (consultation_id is not None and write_id != consultation_id):
+            still_running.append((future, write_id, patient_name))
+            if not future.done():
+                in_flight.add(write_id)
+            continue
+        
+        settled = True
+        if future.exception() is not None:
+            st.error(f"Error saving update for {patient_name} (consultation {write_id}): "
+                     f"{str(future.exception())}")
+            overrides.pop(write_id, None)
+            messages.pop(write_id, None)
+    
+    st.session_state._background_writes = still_running
+    if settled:
+        clear_cached_data()
+    return in_flight
+
+def update_consultation_status_bulk(pending):
+    """
+    Apply queued {consultation_id: updates} in as few round-trips as possible
+    
+    Rows sharing an identical payload go out as one PATCH ... WHERE id IN (...),
+    and distinct payloads are sent concurrently. A bulk upsert can't be used for
+    partial rows: Postgres checks NOT NULL on the would-be inserted row first.
+    """
+    if not pending:
+        return True
+    
+    groups = {}
+    for consultation_id, updates in pending.items():
+        key = json.dumps(updates, sort_keys=True, default=str)
+        groups.setdefault(key, (updates, []))[1].append(consultation_id)
+    
+    def send(updates, ids):
+        return lambda: (supabase.table('Consultations')
             .update(updates)
-            .eq('id', consultation_id)
+            .in_('id', ids)
             .execute())
-        return response.data
+    
+    try:
+        fetch_concurrently(*[send(updates, ids) for updates, ids in groups.values()])
+        return True
     except Exception as e:
-        st.error(f"Error updating consultation: {str(e)}")
-        return None
+        st.error(f"Error applying batched updates: {str(e)}")
+        return False
+    finally:
+        # Some groups may have landed even if another failed
+        clear_cached_data()
+
+def clear_queue_cache():
+    """Drop only the cached Live Queue reads"""
+    get_consultations.clear()
+    get_queue_summary.clear()
+
+def clear_cached_data():
+    """Drop cached query results so the next rerun re-fetches from Supabase"""
+    get_consultations.clear()
+    get_queue_summary.clear()
+    get_all_consultations.clear()
+    get_analytics_df.clear()
+    get_inventory.clear()
+    get_inventory_df.clear()
+    export_consultations_csv.clear()
+    export_inventory_csv.clear()
+    get_doctors.clear()
+    get_pharmacists.clear()
+    get_pharmacies.clear()
+    get_users.clear()
+    get_orders.clear()
+    get_payments.clear()
 
 def add_doctor(doctor_data):
     """Add new doctor to database"""
     try:
         response = supabase.table('doctors').insert(doctor_data).execute()
+        get_doctors.clear()
         return response.data
     except Exception as e:
         st.error(f"Error adding doctor: {str(e)}")
@@ -233,6 +489,7 @@ def add_pharmacist(pharmacist_data):
     """Add new pharmacist to database"""
     try:
         response = supabase.table('pharmacists').insert(pharmacist_data).execute()
+        get_pharmacists.clear()
         return response.data
     except Exception as e:
         st.error(f"Error adding pharmacist: {str(e)}")
@@ -242,11 +499,201 @@ def add_pharmacy(pharmacy_data):
     """Add new pharmacy to database"""
     try:
         response = supabase.table('pharmacies').insert(pharmacy_data).execute()
+        get_pharmacies.clear()
         return response.data
     except Exception as e:
         st.error(f"Error adding pharmacy: {str(e)}")
         return None
 
+# ============================================================================
+# DISPLAY HELPERS
+# ============================================================================
+
+PRIORITY_DTYPE = pd.CategoricalDtype(['URGENT', 'MODERATE', 'LOW'])
+
+# Priority styling for Live Queue cards: (icon, Streamlit markdown colour)
+PRIORITY_STYLE = {
+    'URGENT': ('🔴', 'red'),
+    'MODERATE': ('🟡', 'orange'),
+    'LOW': ('🟢', 'green')
+}
+CARD_HEADER_TMPL = ":{color}[{icon} {priority}] - {name}"
+
+# Card radio label -> diagnosis_agreement value stored on the consultation
+AGREEMENT_MAP = {
+    'Agree with AI': 'agreed',
+    'Partially agree': 'modified',
+    'Disagree with AI': 'disagreed'
+}
+
+# Provider badges use Streamlit's native coloured markdown instead of raw HTML
+PROVIDER_BADGES = {
+    'doctor': ':blue-background[👨‍⚕️ DOCTOR]',
+    'pharmacist': ':violet-background[💊 PHARMACIST]'
+}
+UNASSIGNED_BADGE = ':red-background[⚠️ UNASSIGNED]'
+
+def patient_info_markdown(patient):
+    """Patient information block for a queue card"""
+    # Build the whole block as one markdown element instead of one per line
+    info_lines = [
+        "#### 📋 Patient Information",
+        f"**📞 Phone:** {patient.get('patient_phone', 'N/A')}",
+        f"**🩺 Symptoms:** {patient['symptoms']}",
+        f"**📊 Severity:** {patient.get('severity', 'N/A')}",
+        f"**⏰ Duration:** {patient.get('duration', 'N/A')}"
+    ]
+    
+    created_at = patient.get('created_at', '')
+    if created_at:
+        # _received_str is preformatted for the whole queue; NaN if unparseable
+        received = patient.get('_received_str')
+        info_lines.append(f"**🕐 Received:** {received if isinstance(received, str) else created_at[:16]}")
+    
+    return "\n\n".join(info_lines)
+
+# Inventory table headers/formatting, rendered natively by st.dataframe
+INVENTORY_COLUMN_CONFIG = {
+    'medication_name': st.column_config.TextColumn("Medication"),
+    'current_stock': st.column_config.NumberColumn("Current Stock", format="%d units"),
+    'reorder_point': st.column_config.NumberColumn("Reorder Point", format="%d units"),
+    'monthly_demand': st.column_config.NumberColumn("Monthly Demand", format="%d units"),
+    'unit_price': st.column_config.NumberColumn("Unit Price", format="₦%.2f"),
+    'status': st.column_config.TextColumn("Status")
+}
+
+@st.cache_data(ttl=30, max_entries=4, show_spinner=False)
+def dataframe_csv(df):
+    """
+    UTF-8 CSV bytes for a download button, cached on the frame's contents
+    
+    Each distinct search/filter result is its own entry (holding patient contact
+    details), so only the last few are kept, and only for the data caches' TTL.
+    """
+    return df.to_csv(index=False).encode('utf-8')
+
+def stock_status_styles(df):
+    """Row background colours for the inventory table (red = low stock, green = OK)"""
+    colours = np.where(df['status'] == 'Low Stock', 'background-color: #ffebee', 'background-color: #e8f5e9')
+    return pd.DataFrame(np.repeat(colours[:, None], df.shape[1], axis=1),
+                        index=df.index, columns=df.columns)
+
+# ============================================================================
+# CHART BUILDERS
+# ============================================================================
+# Figures are cached on their input data, so reruns triggered by unrelated
+# widgets reuse the built Plotly objects instead of re-creating every trace.
+# cache_resource hands back the same Figure without a pickle round-trip, so
+# callers must treat the returned figures as read-only.
+# The inputs change whenever the data caches expire, so entries are bounded to
+# the same 30s TTL and a few per builder rather than piling up for the process.
+CHART_CACHE_TTL = 30
+CHART_CACHE_ENTRIES = 8
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_daily_volume_chart(daily_counts):
+    """Line chart of sessions per day"""
+    import plotly.express as px
+    fig = px.line(daily_counts, x='date', y='count',
+                 title='Daily Session Volume',
+                 labels={'date': 'Date', 'count': 'Sessions'},
+                 render_mode='webgl')
+    fig.update_traces(line_color='#1f77b4', line_width=3)
+    return fig
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_counts_pie(counts, title, color_map=None):
+    """Pie chart from a value_counts() series"""
+    import plotly.express as px
+    return px.pie(values=counts.values, names=counts.index,
+                  title=title,
+                  color_discrete_map=color_map)
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_severity_chart(severity_counts):
+    """Bar chart of severity levels"""
+    import plotly.express as px
+    return px.bar(x=severity_counts.index, y=severity_counts.values,
+                  title='Severity Levels',
+                  labels={'x': 'Severity', 'y': 'Count'},
+                  color=severity_counts.values,
+                  color_continuous_scale='Reds')
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_provider_chart(provider_counts):
+    """Bar chart of sessions per provider type"""
+    import plotly.express as px
+    return px.bar(x=provider_counts.index, y=provider_counts.values,
+                  title='Sessions by Provider Type',
+                  labels={'x': 'Provider Type', 'y': 'Count'},
+                  color=provider_counts.index,
+                  color_discrete_map={'doctor': '#1976d2', 'pharmacist': '#7b1fa2'})
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_provider_response_chart(avg_by_provider):
+    """Bar chart of average response minutes per provider type"""
+    import plotly.express as px
+    return px.bar(avg_by_provider, x='provider_type', y='response_mins',
+                  title='Average Response Time by Provider Type',
+                  labels={'provider_type': 'Provider Type', 'response_mins': 'Minutes'},
+                  color='provider_type',
+                  color_discrete_map={'doctor': '#1976d2', 'pharmacist': '#7b1fa2'})
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_agreement_chart(agreed, modified, disagreed):
+    """Pie chart of provider vs AI assessment agreement"""
+    import plotly.express as px
+    agreement_data = pd.DataFrame({
+        'Category': ['Agreed', 'Modified', 'Disagreed'],
+        'Count': [agreed, modified, disagreed]
+    })
+    
+    return px.pie(agreement_data, values='Count', names='Category',
+                  title='Provider-AI Assessment Agreement',
+                  color='Category',
+                  color_discrete_map={'Agreed': '#4caf50', 'Modified': '#ff9800', 'Disagreed': '#f44336'})
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_stock_levels_chart(names, stock, reorder_points):
+    """Current stock bars against the reorder point line (tuples keep the cache key cheap)"""
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    
+    fig.add_trace(go.Bar(
+        x=names,
+        y=stock,
+        name='Current Stock',
+        marker_color='#1f77b4'
+    ))
+    
+    fig.add_trace(go.Scattergl(
+        x=names,
+        y=reorder_points,
+        name='Reorder Point',
+        line=dict(color='#f44336', dash='dash'),
+        mode='lines+markers'
+    ))
+    
+    fig.update_layout(
+        title='Stock Levels vs Reorder Points',
+        xaxis_title='Medication',
+        yaxis_title='Units',
+        height=400
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False, ttl=CHART_CACHE_TTL, max_entries=CHART_CACHE_ENTRIES)
+def build_inventory_value_chart(names, values):
+    """Bar chart of stock value per medication, highest first"""
+    import plotly.express as px
+    df_value = pd.DataFrame({'medication_name': names, 'total_value': values})
+    return px.bar(df_value.sort_values('total_value', ascending=False),
+                  x='medication_name', y='total_value',
+                  title='Inventory Value by Medication',
+                  labels={'total_value': 'Total Value (₦)', 'medication_name': 'Medication'},
+                  color='total_value',
+                  color_continuous_scale='Blues')
+
 # ============================================================================
 # SIDEBAR NAVIGATION
 # ============================================================================
@@ -290,6 +737,19 @@ page = st.sidebar.radio(
     label_visibility="collapsed"
 )
 
+if st.sidebar.button("🔄 Refresh Data", use_container_width=True):
+    clear_cached_data()
+
+QUEUE_REFRESH_SECONDS = 15
+
+if page == "📊 Live Queue":
+    # Lives outside the queue fragment so switching it re-creates the fragment
+    st.sidebar.toggle(
+        "⏱️ Auto-refresh queue",
+        key='queue_auto_refresh',
+        help=f"Re-run the Live Queue every {QUEUE_REFRESH_SECONDS} seconds to pick up new consultations"
+    )
+
 st.sidebar.markdown("---")
 
 # Show different info based on role
@@ -297,9 +757,9 @@ if user_role == "Admin (You)":
     st.sidebar.markdown("### 📊 Quick Stats")
     
     # Fetch quick stats
-    all_doctors = get_doctors()
-    all_pharmacists = get_pharmacists()
-    all_pharmacies = get_pharmacies()
+    all_doctors, all_pharmacists, all_pharmacies = fetch_concurrently(
+        get_doctors, get_pharmacists, get_pharmacies
+    )
     
     online_doctors = sum(1 for d in all_doctors if d.get('is_online', False))
     online_pharmacists = sum(1 for p in all_pharmacists if p.get('is_online', False))
@@ -321,289 +781,210 @@ else:
 # ============================================================================
 # PAGE 1: LIVE QUEUE
 # ============================================================================
-if page == "📊 Live Queue":
-    st.title("🔔 Live Patient Queue")
-    
-    # Fetch consultations
-    consultations = get_consultations()
-    
-    # Filter based on user role
-    if user_role != "Admin (You)":
-        # Show only consultations for this pharmacy
-        # For now, show all (in production, filter by pharmacy_id)
-        pass
-    
-    # ========================================================================
-    # TOP METRICS
-    # ========================================================================
-    col1, col2, col3, col4 = st.columns(4)
-    
-    urgent_count = sum(1 for p in consultations if p.get('priority') == 'URGENT')
-    
-    with col1:
-        st.metric(
-            "🚨 Urgent Cases", 
-            urgent_count,
-            delta="Needs attention" if urgent_count > 0 else None,
-            delta_color="inverse" if urgent_count > 0 else "off"
-        )
-    
-    with col2:
-        st.metric("👥 Total in Queue", len(consultations))
-    
-    with col3:
-        today = datetime.now().date()
-        today_count = sum(1 for p in consultations 
-                         if datetime.fromisoformat(p['created_at'].replace('Z', '+00:00')).date() == today)
-        st.metric("📅 Today's Sessions", today_count)
+def commit_pending_updates():
+    """Batch-mode commit button callback: write every queued card action"""
+    pending = st.session_state.get('pending_updates', {})
+    if update_consultation_status_bulk(pending):
+        st.session_state.pending_updates = {}
+        st.session_state._batch_saved = len(pending)
+
+def submit_card_action(patient, updates, message):
+    """
+    Single write path for every Live Queue card action
+    
+    Submits the update to the background write executor (or queues it in batch
+    mode), then reruns just this card with the update applied optimistically.
+    The message is shown as pending on that rerun; the write may still fail.
+    """
+    consultation_id = patient['id']
+    messages = st.session_state.setdefault('_card_messages', {})
+    
+    # The decision form keeps its values across submits; reset the chosen action
+    # so pressing Apply again (e.g. after editing the assessment) can't repeat it
+    st.session_state.pop(f"action_{consultation_id}", None)
+    
+    if st.session_state.get('batch_mode'):
+        st.session_state.setdefault('pending_updates', {}).setdefault(consultation_id, {}).update(updates)
+        messages[consultation_id] = f"⏳ Queued: {message}"
+        # Nothing was written yet; rerun the page so the pending-updates bar updates
+        st.rerun()
+    
+    # Write in the background and show the change optimistically right away;
+    # collect_background_writes() reports a failure and reverts the card
+    future = get_write_executor().submit(write_consultation_update, consultation_id, updates)
+    st.session_state.setdefault('_background_writes', []).append(
+        (future, consultation_id, patient.get('patient_name', 'Unknown'))
+    )
+    overrides = st.session_state.setdefault('_card_rows', {})
+    overrides[consultation_id] = {**overrides.get(consultation_id, {}), **updates}
+    messages[consultation_id] = f"💾 Saving… {message}"
     
-    with col4:
-        avg_wait = "5-10 min" if urgent_count > 0 else "15-20 min"
-        st.metric("⏱️ Avg Response Time", avg_wait)
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # The click was handled in a full script run rather than a fragment rerun
+        st.rerun()
+
+@st.fragment
+def render_patient_card(patient):
+    """One Live Queue card; button clicks rerun just this card, not the whole queue"""
+    collect_background_writes(patient['id'])
+    
+    # The fragment is re-invoked with the dict from the last full run, so overlay
+    # the updates written from this card since (dropped once re-fetched)
+    patient = {**patient, **st.session_state.get('_card_rows', {}).get(patient['id'], {})}
+    
+    # Determine priority styling
+    priority = patient.get('priority', 'MODERATE')
+    icon, color = PRIORITY_STYLE.get(priority, PRIORITY_STYLE['MODERATE'])
+    provider_badge = PROVIDER_BADGES.get(patient.get('provider_type'), UNASSIGNED_BADGE)
+    
+    with st.container(border=True):
+        # Patient header
+        st.subheader(CARD_HEADER_TMPL.format(color=color, icon=icon, priority=priority,
+                                             name=patient['patient_name']))
+        st.markdown(provider_badge)
+        
+        message = st.session_state.get('_card_messages', {}).pop(patient['id'], None)
+        if message:
+            st.toast(message)
+        
+        queued = st.session_state.get('pending_updates', {}).get(patient['id'])
+        if queued:
+            st.caption(f"⏳ Queued for batch commit: status → {queued.get('status', 'unchanged')}")
     
-    st.markdown("---")
+        # Two-column layout
+        col1, col2 = st.columns([1, 1])
     
-    # ========================================================================
-    # FILTERS (Admin only)
-    # ========================================================================
-    if user_role == "Admin (You)":
-        col1, col2, col3 = st.columns(3)
-        
+        # LEFT: Patient Information
         with col1:
-            filter_provider = st.selectbox(
-                "Filter by Provider Type:",
-                ["All", "Doctor", "Pharmacist", "Unassigned"]
-            )
-        
-        with col2:
-            filter_status = st.selectbox(
-                "Filter by Status:",
-                ["All", "Pending", "Assigned", "In Progress", "Completed"]
-            )
+            st.markdown(patient_info_markdown(patient))
         
-        with col3:
-            filter_priority = st.selectbox(
-                "Filter by Priority:",
-                ["All", "URGENT", "MODERATE", "LOW"]
-            )
+            if patient.get('detected_keywords'):
+                st.error(f"⚠️ **Alert Keywords:** {patient['detected_keywords']}")
         
-        # Apply filters
-        filtered_consultations = consultations.copy()
+            # Show assigned provider (admin view)
+            if user_role == "Admin (You)":
+                if patient.get('doctor_id'):
+                    doctors = get_doctors()
+                    doctor = next((d for d in doctors if d['id'] == patient['doctor_id']), None)
+                    if doctor:
+                        st.success(f"👨‍⚕️ **Assigned to:** Dr. {doctor['full_name']}")
+                elif patient.get('pharmacist_id'):
+                    pharmacists = get_pharmacists()
+                    pharmacist = next((p for p in pharmacists if p['id'] == patient['pharmacist_id']), None)
+                    if pharmacist:
+                        st.success(f"💊 **Assigned to:** Pharm. {pharmacist['full_name']}")
+    
+        # RIGHT: AI Assessment
+        with col2:
+            st.markdown("#### 🤖 AI Clinical Assessment")
         
-        if filter_provider != "All":
-            if filter_provider == "Unassigned":
-                filtered_consultations = [c for c in filtered_consultations 
-                                         if not c.get('pharmacist_id') and not c.get('doctor_id')]
+            if patient.get('ai_diagnosis'):
+                st.info(f"**Assessment:** {patient['ai_diagnosis']}")
             else:
-                filtered_consultations = [c for c in filtered_consultations 
-                                         if c.get('provider_type', '').lower() == filter_provider.lower()]
-        
-        if filter_status != "All":
-            filtered_consultations = [c for c in filtered_consultations 
-                                     if c.get('status', '').lower() == filter_status.lower()]
+                st.info("AI assessment not available for this session")
         
-        if filter_priority != "All":
-            filtered_consultations = [c for c in filtered_consultations 
-                                     if c.get('priority') == filter_priority]
-        
-        consultations = filtered_consultations
-        st.markdown("---")
+            if patient.get('ai_drug_recommendations'):
+                st.success(f"**Recommended Medications:**\n\n{patient['ai_drug_recommendations']}")
+            else:
+                st.write("No AI medication recommendations available")
     
-    # ========================================================================
-    # DISPLAY CONSULTATIONS
-    # ========================================================================
+        st.markdown("---")
     
-    if len(consultations) == 0:
-        st.info("✅ No patients in queue. System ready for new sessions.")
-    else:
-        for i, patient in enumerate(consultations):
-            # Determine priority styling
-            priority_icons = {
-                'URGENT': '🔴',
-                'MODERATE': '🟡',
-                'LOW': '🟢'
-            }
-            
-            priority_backgrounds = {
-                'URGENT': 'background-color: #ffebee;',
-                'MODERATE': 'background-color: #fff9e6;',
-                'LOW': 'background-color: #e8f5e9;'
-            }
-            
-            priority_borders = {
-                'URGENT': '#f44336',
-                'MODERATE': '#ff9800',
-                'LOW': '#4caf50'
-            }
-            
-            priority = patient.get('priority', 'MODERATE')
-            icon = priority_icons.get(priority, '🟡')
-            bg = priority_backgrounds.get(priority, '')
-            border = priority_borders.get(priority, '#ff9800')
-            
-            # Get provider info
-            provider_type = patient.get('provider_type', 'unassigned')
-            provider_badge = ""
-            
-            if provider_type == 'doctor':
-                provider_badge = "<span class='provider-badge doctor-badge'>👨‍⚕️ DOCTOR</span>"
-            elif provider_type == 'pharmacist':
-                provider_badge = "<span class='provider-badge pharmacist-badge'>💊 PHARMACIST</span>"
-            else:
-                provider_badge = "<span class='provider-badge' style='background-color: #ffebee; color: #f44336;'>⚠️ UNASSIGNED</span>"
-            
-            # Patient header
-            st.markdown(f"""
-                <div style='{bg} padding: 15px; border-radius: 10px; margin: 10px 0; 
-                            border-left: 5px solid {border};'>
-                    <h3>{icon} {priority} - {patient['patient_name']}</h3>
-                    {provider_badge}
-                </div>
-            """, unsafe_allow_html=True)
-            
-            # Two-column layout
-            col1, col2 = st.columns([1, 1])
-            
-            # LEFT: Patient Information
-            with col1:
-                st.markdown("#### 📋 Patient Information")
-                st.write(f"**📞 Phone:** {patient.get('patient_phone', 'N/A')}")
-                st.write(f"**🩺 Symptoms:** {patient['symptoms']}")
-                st.write(f"**📊 Severity:** {patient.get('severity', 'N/A')}")
-                st.write(f"**⏰ Duration:** {patient.get('duration', 'N/A')}")
-                
-                created_at = patient.get('created_at', '')
-                if created_at:
-                    try:
-                        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                        st.write(f"**🕐 Received:** {dt.strftime('%I:%M %p, %b %d')}")
-                    except:
-                        st.write(f"**🕐 Received:** {created_at[:16]}")
-                
-                if patient.get('detected_keywords'):
-                    st.error(f"⚠️ **Alert Keywords:** {patient['detected_keywords']}")
-                
-                # Show assigned provider (admin view)
-                if user_role == "Admin (You)":
-                    if patient.get('doctor_id'):
-                        doctors = get_doctors()
-                        doctor = next((d for d in doctors if d['id'] == patient['doctor_id']), None)
-                        if doctor:
-                            st.success(f"👨‍⚕️ **Assigned to:** Dr. {doctor['full_name']}")
-                    elif patient.get('pharmacist_id'):
-                        pharmacists = get_pharmacists()
-                        pharmacist = next((p for p in pharmacists if p['id'] == patient['pharmacist_id']), None)
-                        if pharmacist:
-                            st.success(f"💊 **Assigned to:** Pharm. {pharmacist['full_name']}")
+        # ================================================================
+        # ADMIN: ASSIGNMENT SECTION
+        # ================================================================
+        if user_role == "Admin (You)" and not patient.get('doctor_id') and not patient.get('pharmacist_id'):
+            st.markdown("#### 🎯 Assign Healthcare Provider")
+        
+            col_assign1, col_assign2 = st.columns(2)
+        
+            with col_assign1:
+                # Fetch available providers
+                doctors = get_doctors()
+                pharmacists = get_pharmacists()
             
-            # RIGHT: AI Assessment
-            with col2:
-                st.markdown("#### 🤖 AI Clinical Assessment")
-                
-                if patient.get('ai_diagnosis'):
-                    st.info(f"**Assessment:** {patient['ai_diagnosis']}")
-                else:
-                    st.info("AI assessment not available for this session")
-                
-                if patient.get('ai_drug_recommendations'):
-                    st.success(f"**Recommended Medications:**\n\n{patient['ai_drug_recommendations']}")
-                else:
-                    st.write("No AI medication recommendations available")
+                online_doctors = [d for d in doctors if d.get('is_online', False)]
+                online_pharmacists = [p for p in pharmacists if p.get('is_online', False)]
             
-            st.markdown("---")
+                st.markdown(
+                    f"**Available Providers:**  \n"
+                    f"👨‍⚕️ Doctors online: {len(online_doctors)}  \n"
+                    f"💊 Pharmacists online: {len(online_pharmacists)}"
+                )
             
-            # ================================================================
-            # ADMIN: ASSIGNMENT SECTION
-            # ================================================================
-            if user_role == "Admin (You)" and not patient.get('doctor_id') and not patient.get('pharmacist_id'):
-                st.markdown("#### 🎯 Assign Healthcare Provider")
-                
-                col_assign1, col_assign2 = st.columns(2)
-                
-                with col_assign1:
-                    # Fetch available providers
-                    doctors = get_doctors()
-                    pharmacists = get_pharmacists()
+                # Provider type selection
+                provider_choice = st.radio(
+                    "Assign to:",
+                    options=['👨‍⚕️ Doctor (₦1,500)', '💊 Pharmacist (₦1,000)'],
+                    key=f"provider_type_{patient['id']}",
+                    help="Doctors for complex cases, Pharmacists for simple medication advice"
+                )
+        
+            with col_assign2:
+                if '👨‍⚕️ Doctor' in provider_choice:
+                    # Select doctor
+                    if len(doctors) == 0:
+                        st.warning("No doctors available. Please add doctors first.")
+                    else:
+                        doctor_options = {d['id']: f"Dr. {d['full_name']} {'🟢' if d.get('is_online') else '🔴'}" 
+                                        for d in doctors}
                     
-                    online_doctors = [d for d in doctors if d.get('is_online', False)]
-                    online_pharmacists = [p for p in pharmacists if p.get('is_online', False)]
+                        selected_doctor_id = st.selectbox(
+                            "Select Doctor:",
+                            options=list(doctor_options.keys()),
+                            format_func=lambda x: doctor_options[x],
+                            key=f"doctor_select_{patient['id']}"
+                        )
                     
-                    st.markdown(f"**Available Providers:**")
-                    st.write(f"👨‍⚕️ Doctors online: {len(online_doctors)}")
-                    st.write(f"💊 Pharmacists online: {len(online_pharmacists)}")
+                        if st.button("✅ Assign to Doctor", key=f"assign_doctor_{patient['id']}", type="primary"):
+                            updates = {
+                                'doctor_id': selected_doctor_id,
+                                'provider_type': 'doctor',
+                                'status': 'assigned',
+                                'consultation_fee': 1500,
+                                'started_at': datetime.now().isoformat()
+                            }
+                            submit_card_action(patient, updates, "✅ Assigned to doctor!")
+            
+                else:  # Pharmacist
+                    if len(pharmacists) == 0:
+                        st.warning("No pharmacists available. Please add pharmacists first.")
+                    else:
+                        pharmacist_options = {p['id']: f"Pharm. {p['full_name']} {'🟢' if p.get('is_online') else '🔴'}" 
+                                            for p in pharmacists}
                     
-                    # Provider type selection
-                    provider_choice = st.radio(
-                        "Assign to:",
-                        options=['👨‍⚕️ Doctor (₦1,500)', '💊 Pharmacist (₦1,000)'],
-                        key=f"provider_type_{patient['id']}",
-                        help="Doctors for complex cases, Pharmacists for simple medication advice"
-                    )
-                
-                with col_assign2:
-                    if '👨‍⚕️ Doctor' in provider_choice:
-                        # Select doctor
-                        if len(doctors) == 0:
-                            st.warning("No doctors available. Please add doctors first.")
-                        else:
-                            doctor_options = {d['id']: f"Dr. {d['full_name']} {'🟢' if d.get('is_online') else '🔴'}" 
-                                            for d in doctors}
-                            
-                            selected_doctor_id = st.selectbox(
-                                "Select Doctor:",
-                                options=list(doctor_options.keys()),
-                                format_func=lambda x: doctor_options[x],
-                                key=f"doctor_select_{patient['id']}"
-                            )
-                            
-                            if st.button("✅ Assign to Doctor", key=f"assign_doctor_{patient['id']}", type="primary"):
-                                updates = {
-                                    'doctor_id': selected_doctor_id,
-                                    'provider_type': 'doctor',
-                                    'status': 'assigned',
-                                    'consultation_fee': 1500,
-                                    'started_at': datetime.now().isoformat()
-                                }
-                                update_consultation_status(patient['id'], updates)
-                                st.success("✅ Assigned to doctor!")
-                                st.rerun()
+                        selected_pharmacist_id = st.selectbox(
+                            "Select Pharmacist:",
+                            options=list(pharmacist_options.keys()),
+                            format_func=lambda x: pharmacist_options[x],
+                            key=f"pharmacist_select_{patient['id']}"
+                        )
                     
-                    else:  # Pharmacist
-                        if len(pharmacists) == 0:
-                            st.warning("No pharmacists available. Please add pharmacists first.")
-                        else:
-                            pharmacist_options = {p['id']: f"Pharm. {p['full_name']} {'🟢' if p.get('is_online') else '🔴'}" 
-                                                for p in pharmacists}
-                            
-                            selected_pharmacist_id = st.selectbox(
-                                "Select Pharmacist:",
-                                options=list(pharmacist_options.keys()),
-                                format_func=lambda x: pharmacist_options[x],
-                                key=f"pharmacist_select_{patient['id']}"
-                            )
-                            
-                            if st.button("✅ Assign to Pharmacist", key=f"assign_pharmacist_{patient['id']}", type="primary"):
-                                updates = {
-                                    'pharmacist_id': selected_pharmacist_id,
-                                    'provider_type': 'pharmacist',
-                                    'status': 'assigned',
-                                    'consultation_fee': 1000,
-                                    'started_at': datetime.now().isoformat()
-                                }
-                                update_consultation_status(patient['id'], updates)
-                                st.success("✅ Assigned to pharmacist!")
-                                st.rerun()
-                
-                st.markdown("---")
-            
-            # ================================================================
-            # PROVIDER CLINICAL DECISION (for assigned cases)
-            # ================================================================
-            if patient.get('doctor_id') or patient.get('pharmacist_id'):
-                st.markdown("#### 👨‍⚕️ Clinical Decision")
-                
+                        if st.button("✅ Assign to Pharmacist", key=f"assign_pharmacist_{patient['id']}", type="primary"):
+                            updates = {
+                                'pharmacist_id': selected_pharmacist_id,
+                                'provider_type': 'pharmacist',
+                                'status': 'assigned',
+                                'consultation_fee': 1000,
+                                'started_at': datetime.now().isoformat()
+                            }
+                            submit_card_action(patient, updates, "✅ Assigned to pharmacist!")
+        
+            st.markdown("---")
+    
+        # ================================================================
+        # PROVIDER CLINICAL DECISION (for assigned cases)
+        # ================================================================
+        if patient.get('doctor_id') or patient.get('pharmacist_id'):
+            st.markdown("#### 👨‍⚕️ Clinical Decision")
+        
+            # One form per card: typing doesn't rerun anything and the chosen
+            # action is applied with a single rerun on submit
+            with st.form(f"decision_form_{patient['id']}", clear_on_submit=False):
                 col_a, col_b = st.columns(2)
-                
+        
                 with col_a:
                     # Diagnosis/Assessment
                     if patient.get('provider_type') == 'doctor':
@@ -612,7 +993,7 @@ if page == "📊 Live Queue":
                     else:
                         diagnosis_label = "Symptom Assessment:"
                         diagnosis_help = "Pharmacist's professional assessment (not diagnosis)"
-                    
+            
                     clinical_assessment = st.text_area(
                         diagnosis_label,
                         value=patient.get('pharmacist_diagnosis', ''),  # field name is legacy
@@ -620,25 +1001,25 @@ if page == "📊 Live Queue":
                         placeholder="Your professional assessment",
                         help=diagnosis_help
                     )
-                    
+            
                     # Agreement level (if AI diagnosis exists)
                     if patient.get('ai_diagnosis'):
                         agreement = st.radio(
                             "AI Assessment Evaluation:",
-                            options=['Agree with AI', 'Partially agree', 'Disagree with AI'],
+                            options=list(AGREEMENT_MAP),
                             key=f"agreement_{patient['id']}",
                             horizontal=True
                         )
                     else:
                         agreement = None
-                
+        
                 with col_b:
                     # Prescription/Recommendations
                     if patient.get('provider_type') == 'doctor':
                         prescription_label = "Prescription:"
                     else:
                         prescription_label = "Medication Recommendations:"
-                    
+            
                     prescription = st.text_area(
                         prescription_label,
                         value=patient.get('pharmacist_prescription', ''),  # field name is legacy
@@ -646,89 +1027,250 @@ if page == "📊 Live Queue":
                         placeholder="Medications and dosages",
                         height=150
                     )
+        
+                # ========================================================
+                # ACTION
+                # ========================================================
+                if patient.get('provider_type') == 'pharmacist':
+                    refer_action = "🏥 Refer to Doctor"
+                else:
+                    refer_action = "🏥 Refer to Hospital"
+            
+                # Reuses the prescription column rather than adding another layout row
+                with col_b:
+                    action = st.selectbox(
+                        "Action:",
+                        options=["✅ Confirm & Complete", "❌ Out of Stock", refer_action, "✔️ Mark Complete"],
+                        index=None,
+                        placeholder="Choose an action",
+                        key=f"action_{patient['id']}"
+                    )
+                    submitted = st.form_submit_button("Apply", type="primary", use_container_width=True)
+        
+            # response_time is stamped by the set_response_time trigger (see
+            # DEPLOYMENT NOTES); completed_at is sent as an aware UTC timestamp
+            # because the open-session filters depend on it
+            if submitted and action is None:
+                st.warning("Choose an action before applying.")
+            elif submitted:
+                if action == "✅ Confirm & Complete":
+                    updates = {
+                        'pharmacist_diagnosis': clinical_assessment,  # legacy field
+                        'pharmacist_prescription': prescription,  # legacy field
+                        'status': 'confirmed',
+                        'pharmacist_response': 'stock_available',
+                        'completed_at': datetime.now(timezone.utc).isoformat()
+                    }
                 
-                # ============================================================
-                # ACTION BUTTONS
-                # ============================================================
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    if st.button("✅ Confirm & Complete", key=f"confirm_{patient['id']}", use_container_width=True):
-                        agreement_map = {
-                            'Agree with AI': 'agreed',
-                            'Partially agree': 'modified',
-                            'Disagree with AI': 'disagreed'
-                        }
-                        
-                        updates = {
-                            'pharmacist_diagnosis': clinical_assessment,  # legacy field
-                            'pharmacist_prescription': prescription,  # legacy field
-                            'status': 'confirmed',
-                            'pharmacist_response': 'stock_available',
-                            'completed_at': datetime.now().isoformat(),
-                            'response_time': datetime.now().isoformat()
-                        }
-                        
-                        if agreement:
-                            updates['diagnosis_agreement'] = agreement_map[agreement]
-                        
-                        update_consultation_status(patient['id'], updates)
-                        st.success(f"✅ Session completed for {patient['patient_name']}")
-                        st.rerun()
-                
-                with col2:
-                    if st.button("❌ Out of Stock", key=f"no_stock_{patient['id']}", use_container_width=True):
-                        updates = {
-                            'pharmacist_diagnosis': clinical_assessment,
-                            'status': 'referred',
-                            'pharmacist_response': 'out_of_stock',
-                            'response_time': datetime.now().isoformat()
-                        }
-                        update_consultation_status(patient['id'], updates)
-                        st.error("❌ Patient referred to alternative pharmacy")
-                        st.rerun()
+                    if agreement:
+                        updates['diagnosis_agreement'] = AGREEMENT_MAP[agreement]
                 
-                with col3:
-                    if patient.get('provider_type') == 'pharmacist':
-                        if st.button("🏥 Refer to Doctor", key=f"refer_{patient['id']}", use_container_width=True):
-                            updates = {
-                                'pharmacist_diagnosis': clinical_assessment,
-                                'status': 'referred_to_doctor',
-                                'pharmacist_response': 'needs_doctor',
-                                'response_time': datetime.now().isoformat()
-                            }
-                            update_consultation_status(patient['id'], updates)
-                            st.warning("🏥 Patient advised to see a doctor")
-                            st.rerun()
-                    else:
-                        if st.button("🏥 Refer to Hospital", key=f"refer_{patient['id']}", use_container_width=True):
-                            updates = {
-                                'pharmacist_diagnosis': clinical_assessment,
-                                'status': 'referred_to_hospital',
-                                'response_time': datetime.now().isoformat()
-                            }
-                            update_consultation_status(patient['id'], updates)
-                            st.warning("🏥 Patient referred to hospital")
-                            st.rerun()
-                
-                with col4:
-                    if st.button("✔️ Mark Complete", key=f"done_{patient['id']}", use_container_width=True):
-                        updates = {
-                            'status': 'completed',
-                            'completed_at': datetime.now().isoformat(),
-                            'response_time': datetime.now().isoformat()
-                        }
-                        update_consultation_status(patient['id'], updates)
-                        st.success(f"✔️ Session completed for {patient['patient_name']}")
-                        st.rerun()
+                    submit_card_action(patient, updates, f"✅ Session completed for {patient['patient_name']}")
             
-            st.markdown("---")
-            st.markdown("---")
+                elif action == "❌ Out of Stock":
+                    updates = {
+                        'pharmacist_diagnosis': clinical_assessment,
+                        'status': 'referred',
+                        'pharmacist_response': 'out_of_stock'
+                    }
+                    submit_card_action(patient, updates, "❌ Patient referred to alternative pharmacy")
+            
+                elif action == "🏥 Refer to Doctor":
+                    updates = {
+                        'pharmacist_diagnosis': clinical_assessment,
+                        'status': 'referred_to_doctor',
+                        'pharmacist_response': 'needs_doctor'
+                    }
+                    submit_card_action(patient, updates, "🏥 Patient advised to see a doctor")
+            
+                elif action == "🏥 Refer to Hospital":
+                    updates = {
+                        'pharmacist_diagnosis': clinical_assessment,
+                        'status': 'referred_to_hospital'
+                    }
+                    submit_card_action(patient, updates, "🏥 Patient referred to hospital")
+            
+                else:  # Mark Complete
+                    updates = {
+                        'status': 'completed',
+                        'completed_at': datetime.now(timezone.utc).isoformat()
+                    }
+                    submit_card_action(patient, updates, f"✔️ Session completed for {patient['patient_name']}")
+
+@st.fragment
+def render_live_queue(refresh_tick=None):
+    """Live patient queue with provider assignment and clinical decisions"""
+    title_col, refresh_col = st.columns([4, 1])
+    
+    with title_col:
+        st.title("🔔 Live Patient Queue")
+    
+    with refresh_col:
+        # The queue cache has a short TTL; this forces a re-fetch right away
+        st.button("🔄 Refresh", key='refresh_queue', use_container_width=True,
+                  on_click=clear_queue_cache)
+    
+    # Queue data is re-fetched on each page run, so per-card overrides are stale
+    # (except rows whose background write hasn't landed yet)
+    in_flight = collect_background_writes()
+    st.session_state._card_rows = {
+        consultation_id: row for consultation_id, row in st.session_state.get('_card_rows', {}).items()
+        if consultation_id in in_flight
+    }
+    
+    # Filter based on user role
+    if user_role != "Admin (You)":
+        # Show only consultations for this pharmacy
+        # For now, show all (in production, filter by pharmacy_id)
+        pass
+    
+    # ========================================================================
+    # TOP METRICS
+    # ========================================================================
+    col1, col2, col3, col4 = st.columns(4)
+    
+    # Metrics are server-side counts of open sessions, not just the page rows
+    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    total_count, urgent_count, today_count = get_queue_summary(today_start.isoformat(), refresh_tick)
+    
+    with col1:
+        st.metric(
+            "🚨 Urgent Cases", 
+            urgent_count,
+            delta="Needs attention" if urgent_count > 0 else None,
+            delta_color="inverse" if urgent_count > 0 else "off"
+        )
+    
+    with col2:
+        st.metric("👥 Total in Queue", total_count)
+    
+    with col3:
+        st.metric("📅 Today's Sessions", today_count)
+    
+    with col4:
+        avg_wait = "5-10 min" if urgent_count > 0 else "15-20 min"
+        st.metric("⏱️ Avg Response Time", avg_wait)
+    
+    st.markdown("---")
+    
+    # ========================================================================
+    # FILTERS (provider/status: Admin only)
+    # ========================================================================
+    filter_provider = filter_status = "All"
+    filter_cols = iter(st.columns(4))
+    
+    if user_role == "Admin (You)":
+        with next(filter_cols):
+            filter_provider = st.selectbox(
+                "Filter by Provider Type:",
+                ["All", "Doctor", "Pharmacist", "Unassigned"]
+            )
+        
+        with next(filter_cols):
+            filter_status = st.selectbox(
+                "Filter by Status:",
+                ["All", "Pending", "Assigned", "In Progress", "Completed"],
+                help="All shows open sessions; pick Completed to see finished ones"
+            )
+    
+    with next(filter_cols):
+        filter_priority = st.selectbox(
+            "Filter by Priority:",
+            ["All", "URGENT", "MODERATE", "LOW"]
+        )
+    
+    with next(filter_cols):
+        page_size = st.selectbox("Show:", [10, 25, 50])
+    
+    # Batch mode queues card actions in session_state and writes them together
+    batch_col, commit_col, discard_col = st.columns([2, 1, 1])
+    
+    with batch_col:
+        st.toggle("🗂️ Batch mode", key='batch_mode',
+                  help="Queue actions from several cards and save them in one go")
+    
+    # Callbacks run before the rerun, so the bar and cards below see the new state
+    pending = st.session_state.get('pending_updates', {})
+    saved = st.session_state.pop('_batch_saved', None)
+    if saved:
+        with commit_col:
+            st.success(f"✅ Saved {saved} updates")
+    if pending:
+        with commit_col:
+            st.button(f"💾 Commit {len(pending)} updates", type="primary",
+                      use_container_width=True, on_click=commit_pending_updates)
+        
+        with discard_col:
+            st.button("🗑️ Discard queued", use_container_width=True,
+                      on_click=st.session_state.pop, args=('pending_updates', None))
+    
+    # Filters and paging are applied server-side by get_consultations
+    queue_filters = dict(
+        priority=None if filter_priority == "All" else filter_priority,
+        status=None if filter_status == "All" else filter_status.lower(),
+        provider=None if filter_provider == "All" else filter_provider.lower(),
+        open_only=filter_status == "All",
+        refresh_tick=refresh_tick
+    )
+    page_number = st.session_state.get('queue_page', 1)
+    consultations, total_matching = get_consultations(
+        limit=page_size, offset=(page_number - 1) * page_size, **queue_filters
+    )
+    
+    # Narrower filters / a bigger page size can leave the stored page past the end
+    page_count = max(math.ceil(total_matching / page_size), 1)
+    if page_number > page_count:
+        page_number = st.session_state.queue_page = page_count
+        consultations, total_matching = get_consultations(
+            limit=page_size, offset=(page_number - 1) * page_size, **queue_filters
+        )
+    
+    # Nothing to page through or render; common off-peak
+    if not consultations:
+        st.markdown("---")
+        st.info("✅ No patients in queue. System ready for new sessions.")
+        return
+    
+    # Format every card's "Received" time in one vectorized pass
+    received_ts = pd.to_datetime([p.get('created_at') for p in consultations],
+                                 utc=True, format='ISO8601', errors='coerce')
+    for p, received in zip(consultations, received_ts.strftime('%I:%M %p, %b %d')):
+        p['_received_str'] = received
+    
+    if page_count > 1:
+        caption_col, page_col = st.columns([3, 1])
+        with caption_col:
+            first = (page_number - 1) * page_size + 1
+            st.caption(f"Showing sessions {first}–{first + len(consultations) - 1} "
+                       f"of {total_matching}, most urgent and longest waiting first")
+        with page_col:
+            st.number_input("Page", min_value=1, max_value=page_count, key='queue_page')
+    st.markdown("---")
+    
+    # ========================================================================
+    # DISPLAY CONSULTATIONS
+    # ========================================================================
+    
+    for patient in consultations:
+        render_patient_card(patient)
+
+@st.fragment(run_every=QUEUE_REFRESH_SECONDS)
+def render_live_queue_auto_refresh():
+    """
+    Live Queue re-run on a timer (sidebar toggle)
+    
+    The queue reads' TTL equals the interval, so a tick could get the previous
+    tick's cached page back. Each interval gets its own cache key instead, which
+    leaves the shared cache of other sessions alone.
+    """
+    render_live_queue(refresh_tick=int(time.time() // QUEUE_REFRESH_SECONDS))
 
 # ============================================================================
 # PAGE 2: DOCTORS MANAGEMENT (Admin only)
 # ============================================================================
-elif page == "👨‍⚕️ Doctors":
+@st.fragment
+def render_doctors():
+    """Doctor network list and onboarding form"""
     st.title("👨‍⚕️ Doctor Network Management")
     
     doctors = get_doctors()
@@ -783,20 +1325,17 @@ elif page == "👨‍⚕️ Doctors":
                 col1, col2, col3, col4, col5 = st.columns(5)
                 
                 with col1:
-                    st.write(f"**📞 Phone:**")
-                    st.write(doctor.get('phone_number', 'N/A'))
+                    st.markdown(f"**📞 Phone:**  \n{doctor.get('phone_number', 'N/A')}")
                 
                 with col2:
-                    st.write(f"**📜 MDCN License:**")
-                    st.write(doctor.get('mdcn_license_number', 'N/A'))
+                    st.markdown(f"**📜 MDCN License:**  \n{doctor.get('mdcn_license_number', 'N/A')}")
                     if doctor.get('license_verified'):
                         st.success("✅ Verified")
                     else:
                         st.warning("⚠️ Pending")
                 
                 with col3:
-                    st.write(f"**💼 Specialization:**")
-                    st.write(doctor.get('specialization', 'General Practice'))
+                    st.markdown(f"**💼 Specialization:**  \n{doctor.get('specialization', 'General Practice')}")
                 
                 with col4:
                     st.write(f"**📊 Consultations:**")
@@ -887,7 +1426,9 @@ elif page == "👨‍⚕️ Doctors":
 # ============================================================================
 # PAGE 3: PHARMACISTS MANAGEMENT (Admin only)
 # ============================================================================
-elif page == "💊 Pharmacists":
+@st.fragment
+def render_pharmacists():
+    """Pharmacist network list and onboarding form"""
     st.title("💊 Pharmacist Network Management")
     
     pharmacists = get_pharmacists()
@@ -941,12 +1482,10 @@ elif page == "💊 Pharmacists":
                 col1, col2, col3, col4 = st.columns(4)
                 
                 with col1:
-                    st.write(f"**📞 Phone:**")
-                    st.write(pharmacist.get('phone_number', 'N/A'))
+                    st.markdown(f"**📞 Phone:**  \n{pharmacist.get('phone_number', 'N/A')}")
                 
                 with col2:
-                    st.write(f"**📜 PCN License:**")
-                    st.write(pharmacist.get('pcn_license_number', 'N/A'))
+                    st.markdown(f"**📜 PCN License:**  \n{pharmacist.get('pcn_license_number', 'N/A')}")
                     if pharmacist.get('license_verified'):
                         st.success("✅ Verified")
                     else:
@@ -1033,7 +1572,9 @@ elif page == "💊 Pharmacists":
 # ============================================================================
 # PAGE 4: PHARMACIES MANAGEMENT (Admin only)
 # ============================================================================
-elif page == "🏪 Pharmacies":
+@st.fragment
+def render_pharmacies():
+    """Partner pharmacy list and onboarding form"""
     st.title("🏪 Pharmacy Partner Management")
     
     pharmacies = get_pharmacies()
@@ -1086,18 +1627,17 @@ elif page == "🏪 Pharmacies":
                 col1, col2, col3 = st.columns(3)
                 
                 with col1:
-                    st.write(f"**📍 Location:**")
-                    st.write(f"{pharmacy.get('city', 'N/A')}, {pharmacy.get('state', 'N/A')}")
-                    st.write(f"**📞 Phone:** {pharmacy.get('phone_number', 'N/A')}")
+                    st.markdown(f"**📍 Location:**  \n{pharmacy.get('city', 'N/A')}, {pharmacy.get('state', 'N/A')}  \n"
+                                f"**📞 Phone:** {pharmacy.get('phone_number', 'N/A')}")
                 
                 with col2:
-                    st.write(f"**📦 Orders Fulfilled:** {pharmacy.get('total_orders_fulfilled', 0)}")
-                    st.write(f"**⭐ Rating:** {pharmacy.get('rating', 0):.1f}")
+                    st.markdown(f"**📦 Orders Fulfilled:** {pharmacy.get('total_orders_fulfilled', 0)}  \n"
+                                f"**⭐ Rating:** {pharmacy.get('rating', 0):.1f}")
                 
                 with col3:
-                    st.write(f"**💰 Revenue:** ₦{pharmacy.get('total_revenue', 0):,.0f}")
                     commission_rate = pharmacy.get('commission_rate', 0.15)
-                    st.write(f"**📊 Commission Rate:** {commission_rate*100:.0f}%")
+                    st.markdown(f"**💰 Revenue:** ₦{pharmacy.get('total_revenue', 0):,.0f}  \n"
+                                f"**📊 Commission Rate:** {commission_rate*100:.0f}%")
                 
                 if pharmacy.get('delivery_available'):
                     st.success(f"🚚 Delivery available - Fee: ₦{pharmacy.get('delivery_fee', 0):,.0f}")
@@ -1190,7 +1730,9 @@ elif page == "🏪 Pharmacies":
 # ============================================================================
 # PAGE 5: PATIENTS (Admin only)
 # ============================================================================
-elif page == "👥 Patients":
+@st.fragment
+def render_patients():
+    """Searchable patient database"""
     st.title("👥 Patient Database")
     
     users = get_users()
@@ -1259,24 +1801,26 @@ elif page == "👥 Patients":
         
         st.dataframe(df_display, use_container_width=True, hide_index=True)
         
-        # Export button
-        if st.button("📥 Export Patient List (CSV)"):
-            csv = df_display.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"patients_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
+        # Export button (single click; CSV bytes cached on the table contents)
+        st.download_button(
+            label="📥 Export Patient List (CSV)",
+            data=dataframe_csv(df_display),
+            file_name=f"patients_{datetime.now().strftime('%Y%m%d')}.csv",
+            mime="text/csv"
+        )
 
 # ============================================================================
 # PAGE 6: PAYMENTS (Admin only)
 # ============================================================================
-elif page == "💰 Payments":
+@st.fragment
+def render_payments():
+    """Revenue breakdown and pending payouts"""
+    import plotly.express as px
     st.title("💰 Payments & Revenue Tracking")
     
-    consultations = get_all_consultations()
-    orders = get_orders()
+    consultations, orders = fetch_concurrently(
+        lambda: get_all_consultations(PAYMENTS_COLUMNS), get_orders
+    )
     
     # Calculate revenue
     consultation_revenue = sum(c.get('platform_revenue', 0) for c in consultations if c.get('status') == 'confirmed')
@@ -1396,21 +1940,24 @@ elif page == "💰 Payments":
             df_consultations = pd.DataFrame(consultations)
             
             if 'created_at' in df_consultations.columns and 'platform_revenue' in df_consultations.columns:
-                df_consultations['date'] = pd.to_datetime(df_consultations['created_at']).dt.date
+                df_consultations['date'] = pd.to_datetime(df_consultations['created_at'], format='ISO8601').dt.date
                 daily_revenue = df_consultations.groupby('date')['platform_revenue'].sum().reset_index()
                 
                 fig = px.line(daily_revenue, x='date', y='platform_revenue',
                              title='Daily Revenue Trend',
-                             labels={'platform_revenue': 'Revenue (₦)', 'date': 'Date'})
+                             labels={'platform_revenue': 'Revenue (₦)', 'date': 'Date'},
+                             render_mode='webgl')
                 st.plotly_chart(fig, use_container_width=True)
 
 # ============================================================================
 # PAGE 7: ANALYTICS (Available to all)
 # ============================================================================
-elif page == "📈 Analytics":
+@st.fragment
+def render_analytics():
+    """Session KPIs and analytics charts"""
     st.title("📈 Analytics & Insights")
     
-    all_consultations = get_all_consultations()
+    df = get_analytics_df()
     
     # Filter by user role
     if user_role != "Admin (You)":
@@ -1418,33 +1965,26 @@ elif page == "📈 Analytics":
         # In production, filter by pharmacy_id
         pass
     
-    if not all_consultations:
+    if df.empty:
         st.warning("No session data available yet. Data will appear once sessions are recorded.")
-        st.stop()
-    
-    df = pd.DataFrame(all_consultations)
+        return
     
     # ========================================================================
     # KPI CARDS
     # ========================================================================
     col1, col2, col3, col4 = st.columns(4)
     
+    # Column reductions shared by the KPI cards and the charts below
+    priority_counts = df['priority'].value_counts() if 'priority' in df.columns else pd.Series(dtype='int64')
+    status_counts = df['status'].value_counts() if 'status' in df.columns else pd.Series(dtype='int64')
+    
     total_consultations = len(df)
-    urgent_count = len(df[df['priority'] == 'URGENT']) if 'priority' in df.columns else 0
+    urgent_count = int(priority_counts.get('URGENT', 0))
     urgent_pct = (urgent_count / total_consultations * 100) if total_consultations > 0 else 0
     
-    # Calculate average response time
-    df_with_response = df[df['response_time'].notna()] if 'response_time' in df.columns else pd.DataFrame()
-    
-    if len(df_with_response) > 0:
-        try:
-            df_with_response['created_dt'] = pd.to_datetime(df_with_response['created_at'])
-            df_with_response['response_dt'] = pd.to_datetime(df_with_response['response_time'])
-            df_with_response['response_mins'] = (df_with_response['response_dt'] - df_with_response['created_dt']).dt.total_seconds() / 60
-            avg_response = df_with_response['response_mins'].mean()
-        except:
-            avg_response = 0
-    else:
+    # Average response time (response_mins is precomputed by get_analytics_df; NaN = no response)
+    avg_response = df['response_mins'].mean() if 'response_mins' in df.columns else 0
+    if pd.isna(avg_response):
         avg_response = 0
     
     with col1:
@@ -1458,98 +1998,91 @@ elif page == "📈 Analytics":
         st.metric("Avg Response Time", f"{int(avg_response)} min" if avg_response > 0 else "N/A")
     
     with col4:
-        completed = len(df[df['status'] == 'confirmed']) if 'status' in df.columns else 0
+        completed = int(status_counts.get('confirmed', 0))
         st.metric("Completed", completed, 
                  delta=f"{(completed/total_consultations*100):.0f}%" if total_consultations > 0 else "0%")
     
     st.markdown("---")
     
+    render_analytics_views(df, priority_counts, status_counts)
+
+@st.fragment
+def render_analytics_views(df, priority_counts, status_counts):
+    """Analytics chart views; switching views reruns only this fragment, not the KPIs"""
     # ========================================================================
-    # CHARTS IN TABS
+    # CHART VIEWS
     # ========================================================================
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 Overview", "🎯 Severity Analysis", "👨‍⚕️ Provider Performance", "🤖 AI Performance"])
-    
-    with tab1:
+    # Only the selected view builds its charts (st.tabs renders every tab on each rerun)
+    analytics_view = st.radio(
+        "Analytics View",
+        ["📊 Overview", "🎯 Severity Analysis", "👨‍⚕️ Provider Performance", "🤖 AI Performance"],
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+    
+    if analytics_view == "📊 Overview":
         st.subheader("Session Trends")
         
-        if 'created_at' in df.columns:
-            df['date'] = pd.to_datetime(df['created_at']).dt.date
+        # df is already loaded for the KPIs above, so group it here rather than
+        # making another round trip for pre-aggregated counts
+        if 'date' in df.columns:
             daily_counts = df.groupby('date').size().reset_index(name='count')
             
-            fig = px.line(daily_counts, x='date', y='count',
-                         title='Daily Session Volume',
-                         labels={'date': 'Date', 'count': 'Sessions'})
-            fig.update_traces(line_color='#1f77b4', line_width=3)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_daily_volume_chart(daily_counts), use_container_width=True)
         
         # Status distribution
         if 'status' in df.columns:
-            status_counts = df['status'].value_counts()
-            fig2 = px.pie(values=status_counts.values, names=status_counts.index,
-                         title='Session Status Distribution')
-            st.plotly_chart(fig2, use_container_width=True)
+            st.plotly_chart(build_counts_pie(status_counts, 'Session Status Distribution'),
+                            use_container_width=True)
     
-    with tab2:
+    elif analytics_view == "🎯 Severity Analysis":
         st.subheader("Severity Distribution")
         
         if 'priority' in df.columns:
-            priority_counts = df['priority'].value_counts()
-            
-            fig3 = px.pie(values=priority_counts.values, names=priority_counts.index,
-                         title='Priority Distribution',
-                         color_discrete_map={'URGENT':'#f44336', 'MODERATE':'#ff9800', 'LOW':'#4caf50'})
-            st.plotly_chart(fig3, use_container_width=True)
+            st.plotly_chart(build_counts_pie(priority_counts, 'Priority Distribution',
+                                             {'URGENT':'#f44336', 'MODERATE':'#ff9800', 'LOW':'#4caf50'}),
+                            use_container_width=True)
         
         if 'severity' in df.columns and df['severity'].notna().any():
             severity_counts = df['severity'].value_counts()
-            fig4 = px.bar(x=severity_counts.index, y=severity_counts.values,
-                         title='Severity Levels',
-                         labels={'x': 'Severity', 'y': 'Count'},
-                         color=severity_counts.values,
-                         color_continuous_scale='Reds')
-            st.plotly_chart(fig4, use_container_width=True)
+            st.plotly_chart(build_severity_chart(severity_counts), use_container_width=True)
     
-    with tab3:
+    elif analytics_view == "👨‍⚕️ Provider Performance":
         st.subheader("Provider Performance")
         
         if 'provider_type' in df.columns and df['provider_type'].notna().any():
             # Provider type distribution
             provider_counts = df['provider_type'].value_counts()
             
-            fig_provider = px.bar(x=provider_counts.index, y=provider_counts.values,
-                                 title='Sessions by Provider Type',
-                                 labels={'x': 'Provider Type', 'y': 'Count'},
-                                 color=provider_counts.index,
-                                 color_discrete_map={'doctor': '#1976d2', 'pharmacist': '#7b1fa2'})
-            st.plotly_chart(fig_provider, use_container_width=True)
+            st.plotly_chart(build_provider_chart(provider_counts), use_container_width=True)
             
             # Response time by provider type
-            if len(df_with_response) > 0 and 'provider_type' in df_with_response.columns:
-                avg_by_provider = df_with_response.groupby('provider_type')['response_mins'].mean().reset_index()
+            if 'response_mins' in df.columns and df['response_mins'].notna().any():
+                avg_by_provider = df.groupby('provider_type')['response_mins'].mean().dropna().reset_index()
                 
-                fig_resp = px.bar(avg_by_provider, x='provider_type', y='response_mins',
-                                 title='Average Response Time by Provider Type',
-                                 labels={'provider_type': 'Provider Type', 'response_mins': 'Minutes'},
-                                 color='provider_type',
-                                 color_discrete_map={'doctor': '#1976d2', 'pharmacist': '#7b1fa2'})
-                st.plotly_chart(fig_resp, use_container_width=True)
+                st.plotly_chart(build_provider_response_chart(avg_by_provider), use_container_width=True)
         else:
             st.info("Provider performance data will appear once sessions are assigned to doctors/pharmacists.")
     
-    with tab4:
+    elif analytics_view == "🤖 AI Performance":
         st.subheader("🤖 AI Diagnostic Performance")
         
-        ai_consultations = df[df['ai_diagnosis'].notna() & df['pharmacist_diagnosis'].notna()] if 'ai_diagnosis' in df.columns and 'pharmacist_diagnosis' in df.columns else pd.DataFrame()
+        # One boolean mask over the columns; no reviewed-sessions sub-DataFrame is built
+        if 'ai_diagnosis' in df.columns and 'pharmacist_diagnosis' in df.columns:
+            reviewed = df['ai_diagnosis'].notna() & df['pharmacist_diagnosis'].notna()
+        else:
+            reviewed = pd.Series(False, index=df.index)
+        
+        total_reviewed = int(reviewed.sum())
         
-        if len(ai_consultations) > 0:
+        if total_reviewed > 0:
             col1, col2, col3 = st.columns(3)
             
-            total_reviewed = len(ai_consultations)
-            
-            if 'diagnosis_agreement' in ai_consultations.columns:
-                agreed = len(ai_consultations[ai_consultations['diagnosis_agreement'] == 'agreed'])
-                modified = len(ai_consultations[ai_consultations['diagnosis_agreement'] == 'modified'])
-                disagreed = len(ai_consultations[ai_consultations['diagnosis_agreement'] == 'disagreed'])
+            if 'diagnosis_agreement' in df.columns:
+                agreement_counts = df.loc[reviewed, 'diagnosis_agreement'].value_counts()
+                agreed = int(agreement_counts.get('agreed', 0))
+                modified = int(agreement_counts.get('modified', 0))
+                disagreed = int(agreement_counts.get('disagreed', 0))
             else:
                 agreed = modified = disagreed = 0
             
@@ -1569,44 +2102,32 @@ elif page == "📈 Analytics":
                          delta=f"{disagreed}/{total_reviewed}")
             
             if agreed + modified + disagreed > 0:
-                agreement_data = pd.DataFrame({
-                    'Category': ['Agreed', 'Modified', 'Disagreed'],
-                    'Count': [agreed, modified, disagreed]
-                })
-                
-                fig5 = px.pie(agreement_data, values='Count', names='Category',
-                             title='Provider-AI Assessment Agreement',
-                             color='Category',
-                             color_discrete_map={'Agreed': '#4caf50', 'Modified': '#ff9800', 'Disagreed': '#f44336'})
-                st.plotly_chart(fig5, use_container_width=True)
+                st.plotly_chart(build_agreement_chart(agreed, modified, disagreed), use_container_width=True)
         else:
             st.info("AI performance data will appear once sessions with AI assessments are completed.")
 
 # ============================================================================
 # PAGE 8: INVENTORY (Available to all)
 # ============================================================================
-elif page == "📦 Inventory":
+@st.fragment
+def render_inventory():
+    """Medication stock levels and inventory charts"""
     st.title("📦 Inventory Management")
     
-    medications = get_inventory()
+    df_inv = get_inventory_df()
     
-    if not medications:
+    if df_inv.empty:
         st.warning("No inventory data available. Add medications in Supabase Table Editor.")
-        st.stop()
-    
-    df_inv = pd.DataFrame(medications)
+        return
     
     # ========================================================================
     # SUMMARY METRICS
     # ========================================================================
     col1, col2, col3, col4 = st.columns(4)
     
-    low_stock_count = len(df_inv[df_inv['status'] == 'Low Stock']) if 'status' in df_inv.columns else 0
+    low_stock_count = int(df_inv['_is_low'].sum()) if '_is_low' in df_inv.columns else 0
     
-    if 'current_stock' in df_inv.columns and 'unit_price' in df_inv.columns:
-        total_value = (df_inv['current_stock'] * df_inv['unit_price']).sum()
-    else:
-        total_value = 0
+    total_value = df_inv['total_value'].sum() if 'total_value' in df_inv.columns else 0
     
     with col1:
         st.metric("⚠️ Low Stock Items", low_stock_count,
@@ -1626,11 +2147,16 @@ elif page == "📦 Inventory":
     st.markdown("---")
     
     # ========================================================================
-    # TABS
+    # VIEWS
     # ========================================================================
-    tab1, tab2 = st.tabs(["📋 Current Stock", "📊 Analytics"])
-    
-    with tab1:
+    inventory_view = st.radio(
+        "Inventory View",
+        ["📋 Current Stock", "📊 Analytics"],
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+    
+    if inventory_view == "📋 Current Stock":
         st.subheader("Medication Inventory")
         
         col1, col2 = st.columns([3, 1])
@@ -1641,83 +2167,93 @@ elif page == "📦 Inventory":
         with col2:
             filter_option = st.selectbox("Filter", ["All", "Low Stock", "OK"])
         
-        df_display = df_inv.copy()
+        # Combine search and status filter into one mask so at most one frame is
+        # materialized; with neither active the cached frame is used as-is
+        mask = None
         
         if search:
-            df_display = df_display[df_display['medication_name'].str.contains(search, case=False, na=False)]
+            mask = df_inv['_name_lower'].str.contains(search.lower(), na=False, regex=False).values
+        
+        if filter_option != "All":
+            if filter_option == "Low Stock" and '_is_low' in df_inv.columns:
+                status_mask = df_inv['_is_low'].values
+            else:
+                status_mask = df_inv['status'].values == filter_option
+            mask = status_mask if mask is None else mask & status_mask
         
-        if filter_option == "Low Stock":
-            df_display = df_display[df_display['status'] == 'Low Stock']
-        elif filter_option == "OK":
-            df_display = df_display[df_display['status'] == 'OK']
+        df_display = df_inv if mask is None else df_inv[mask]
         
-        for idx, row in df_display.iterrows():
-            status_color = '#ffebee' if row.get('status') == 'Low Stock' else '#e8f5e9'
-            status_icon = '⚠️' if row.get('status') == 'Low Stock' else '✅'
-            
-            st.markdown(f"""
-                <div style='background-color: {status_color}; padding: 15px; border-radius: 10px; margin: 10px 0;'>
-                    <h4>{status_icon} {row['medication_name']}</h4>
-                </div>
-            """, unsafe_allow_html=True)
-            
-            col1, col2, col3, col4 = st.columns(4)
+        display_cols = [col for col in ['medication_name', 'current_stock', 'reorder_point', 
+                                        'monthly_demand', 'unit_price', 'status'] 
+                        if col in df_display.columns]
+        
+        if len(df_display) == 0:
+            st.info("No medications match your search.")
+        else:
+            table = df_display[display_cols]
+            if 'status' in table.columns:
+                table = table.style.apply(stock_status_styles, axis=None)
+            st.dataframe(table, use_container_width=True, hide_index=True,
+                         column_config=INVENTORY_COLUMN_CONFIG)
             
-            with col1:
-                st.metric("Current Stock", f"{row.get('current_stock', 0)} units")
-            with col2:
-                st.metric("Reorder Point", f"{row.get('reorder_point', 0)} units")
-            with col3:
-                st.metric("Monthly Demand", f"{row.get('monthly_demand', 0)} units")
-            with col4:
-                st.metric("Unit Price", f"₦{row.get('unit_price', 0)}")
+            # Per-item cards are opt-in: they cost ~5 elements per medication
+            if st.toggle("Card view"):
+                # itertuples yields lightweight namedtuples instead of boxing each row into a Series
+                # (_is_low is zipped in: itertuples renames underscore-prefixed columns)
+                is_low_flags = df_display['_is_low'] if '_is_low' in df_display.columns else [False] * len(df_display)
+                for row, is_low in zip(df_display.itertuples(index=False), is_low_flags):
+                    status_icon = '⚠️' if is_low else '✅'
+                    
+                    with st.container(border=True):
+                        st.markdown(f"#### {status_icon} {row.medication_name}")
+                        
+                        col1, col2, col3, col4 = st.columns(4)
+                        
+                        with col1:
+                            st.metric("Current Stock", f"{getattr(row, 'current_stock', 0)} units")
+                        with col2:
+                            st.metric("Reorder Point", f"{getattr(row, 'reorder_point', 0)} units")
+                        with col3:
+                            st.metric("Monthly Demand", f"{getattr(row, 'monthly_demand', 0)} units")
+                        with col4:
+                            st.metric("Unit Price", f"₦{getattr(row, 'unit_price', 0)}")
+        
+        # Reorder helper for low stock items
+        if '_is_low' in df_display.columns:
+            low_stock_items = df_display[df_display['_is_low']]
             
-            st.markdown("---")
+            if len(low_stock_items) > 0:
+                col1, col2 = st.columns([3, 1])
+                
+                with col1:
+                    reorder_item = st.selectbox("Reorder item", low_stock_items['medication_name'])
+                
+                with col2:
+                    calculate_reorder = st.button("📦 Calculate Reorder", use_container_width=True)
+                
+                if calculate_reorder:
+                    row = low_stock_items[low_stock_items['medication_name'] == reorder_item].iloc[0]
+                    reorder_qty = max(int(row.get('monthly_demand', 0) - row.get('current_stock', 0)), 0)
+                    st.info(f"📦 Reorder **{reorder_qty} units** of {reorder_item}")
     
-    with tab2:
+    else:
         st.subheader("Inventory Analytics")
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            x=df_inv['medication_name'],
-            y=df_inv['current_stock'],
-            name='Current Stock',
-            marker_color='#1f77b4'
-        ))
-        
-        fig.add_trace(go.Scatter(
-            x=df_inv['medication_name'],
-            y=df_inv['reorder_point'],
-            name='Reorder Point',
-            line=dict(color='#f44336', dash='dash'),
-            mode='lines+markers'
-        ))
-        
-        fig.update_layout(
-            title='Stock Levels vs Reorder Points',
-            xaxis_title='Medication',
-            yaxis_title='Units',
-            height=400
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-        
-        df_inv['total_value'] = df_inv['current_stock'] * df_inv['unit_price']
+        names = tuple(df_inv['medication_name'])
         
-        fig2 = px.bar(df_inv.sort_values('total_value', ascending=False),
-                     x='medication_name', y='total_value',
-                     title='Inventory Value by Medication',
-                     labels={'total_value': 'Total Value (₦)', 'medication_name': 'Medication'},
-                     color='total_value',
-                     color_continuous_scale='Blues')
+        st.plotly_chart(build_stock_levels_chart(names, tuple(df_inv['current_stock']),
+                                                 tuple(df_inv['reorder_point'])),
+                        use_container_width=True)
         
-        st.plotly_chart(fig2, use_container_width=True)
+        st.plotly_chart(build_inventory_value_chart(names, tuple(df_inv['total_value'])),
+                        use_container_width=True)
 
 # ============================================================================
 # PAGE 9: SETTINGS (Available to all)
 # ============================================================================
-elif page == "⚙️ Settings":
+@st.fragment
+def render_settings():
+    """Business, pricing, notification and data settings"""
     st.title("⚙️ System Settings")
     
     tab1, tab2, tab3, tab4 = st.tabs(["🏪 Business Info", "💰 Pricing", "🔔 Notifications", "📊 Data Management"])
@@ -1725,35 +2261,37 @@ elif page == "⚙️ Settings":
     with tab1:
         st.subheader("Business Information")
         
-        if user_role == "Admin (You)":
-            st.info("Configure your OgaDoctor marketplace settings")
+        # Fields are only read on save, so edits inside the form don't rerun the page
+        with st.form("business_info_form"):
+            if user_role == "Admin (You)":
+                st.info("Configure your OgaDoctor marketplace settings")
             
-            col1, col2 = st.columns(2)
+                col1, col2 = st.columns(2)
             
-            with col1:
-                business_name = st.text_input("Business Name", "OgaDoctor Health Services")
-                admin_phone = st.text_input("Admin Phone", "+234 XXX XXX XXXX")
-                admin_email = st.text_input("Admin Email", "admin@ogadoctor.com")
+                with col1:
+                    st.text_input("Business Name", "OgaDoctor Health Services")
+                    st.text_input("Admin Phone", "+234 XXX XXX XXXX")
+                    st.text_input("Admin Email", "admin@ogadoctor.com")
             
-            with col2:
-                business_address = st.text_area("Business Address", "Leeds, United Kingdom")
-                timezone = st.selectbox("Timezone", ["Africa/Lagos (WAT)", "Europe/London (GMT)", "UTC"])
-        else:
-            st.subheader("Pharmacy Information")
+                with col2:
+                    st.text_area("Business Address", "Leeds, United Kingdom")
+                    st.selectbox("Timezone", ["Africa/Lagos (WAT)", "Europe/London (GMT)", "UTC"])
+            else:
+                st.subheader("Pharmacy Information")
             
-            col1, col2 = st.columns(2)
+                col1, col2 = st.columns(2)
             
-            with col1:
-                pharmacy_name = st.text_input("Pharmacy Name", "Blue Pill Pharmacy")
-                phone = st.text_input("Phone Number", "+234 803 XXX XXXX")
-                email = st.text_input("Email", "contact@bluepill.ng")
+                with col1:
+                    st.text_input("Pharmacy Name", "Blue Pill Pharmacy")
+                    st.text_input("Phone Number", "+234 803 XXX XXXX")
+                    st.text_input("Email", "contact@bluepill.ng")
             
-            with col2:
-                address = st.text_area("Address", "123 Main Street\nAwka, Anambra State")
-                hours = st.text_input("Operating Hours", "8AM - 8PM Mon-Sat")
+                with col2:
+                    st.text_area("Address", "123 Main Street\nAwka, Anambra State")
+                    st.text_input("Operating Hours", "8AM - 8PM Mon-Sat")
         
-        if st.button("💾 Save Changes", type="primary"):
-            st.success("✅ Information updated successfully!")
+            if st.form_submit_button("💾 Save Changes", type="primary"):
+                st.success("✅ Information updated successfully!")
     
     with tab2:
         st.subheader("Pricing Configuration")
@@ -1808,15 +2346,16 @@ elif page == "⚙️ Settings":
     with tab3:
         st.subheader("Notification Settings")
         
-        st.checkbox("📧 Email notifications for urgent cases", value=True)
-        st.checkbox("📱 SMS alerts for new sessions", value=True)
-        st.checkbox("💬 WhatsApp integration", value=True)
-        st.checkbox("🔔 Browser notifications", value=False)
-        
-        st.slider("Alert threshold for urgent cases (minutes)", 5, 30, 10)
-        
-        if st.button("💾 Save Notification Settings", type="primary"):
-            st.success("✅ Notification settings updated!")
+        with st.form("notification_settings_form"):
+            st.checkbox("📧 Email notifications for urgent cases", value=True)
+            st.checkbox("📱 SMS alerts for new sessions", value=True)
+            st.checkbox("💬 WhatsApp integration", value=True)
+            st.checkbox("🔔 Browser notifications", value=False)
+            
+            st.slider("Alert threshold for urgent cases (minutes)", 5, 30, 10)
+            
+            if st.form_submit_button("💾 Save Notification Settings", type="primary"):
+                st.success("✅ Notification settings updated!")
     
     with tab4:
         st.subheader("Data Management")
@@ -1825,46 +2364,46 @@ elif page == "⚙️ Settings":
         
         with col1:
             st.markdown("### 📤 Export Data")
+            export_date = datetime.now().strftime('%Y%m%d')
             
-            if st.button("Export Consultations (CSV)"):
-                consultations = get_all_consultations()
-                if consultations:
-                    df_export = pd.DataFrame(consultations)
-                    csv = df_export.to_csv(index=False)
-                    st.download_button(
-                        label="Download CSV",
-                        data=csv,
-                        file_name=f"consultations_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv"
-                    )
-                else:
-                    st.warning("No data to export")
+            # The consultations export reads the whole table, and tabs render on
+            # every Settings run, so the CSV is passed as a callable: it is only
+            # built when the button is clicked. The id-only read (shared with the
+            # Database Info counts) is enough to know whether there's anything
+            has_consultations = bool(get_all_consultations('id'))
+            st.download_button(
+                label="Export Consultations (CSV)",
+                data=export_consultations_csv,
+                file_name=f"consultations_{export_date}.csv",
+                mime="text/csv",
+                disabled=not has_consultations,
+                help=None if has_consultations else "No data to export"
+            )
             
-            if st.button("Export Inventory (CSV)"):
-                inventory = get_inventory()
-                if inventory:
-                    df_export = pd.DataFrame(inventory)
-                    csv = df_export.to_csv(index=False)
-                    st.download_button(
-                        label="Download CSV",
-                        data=csv,
-                        file_name=f"inventory_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv"
-                    )
-                else:
-                    st.warning("No data to export")
+            # Inventory is already fetched for the Database Info counts, so it's built eagerly
+            inventory_csv = export_inventory_csv()
+            st.download_button(
+                label="Export Inventory (CSV)",
+                data=inventory_csv,
+                file_name=f"inventory_{export_date}.csv",
+                mime="text/csv",
+                disabled=not inventory_csv,
+                help=None if inventory_csv else "No data to export"
+            )
         
         with col2:
             st.markdown("### 🗄️ Database Info")
             
-            consultations_count = len(get_all_consultations())
-            medications_count = len(get_inventory())
+            # Counts come from the cached fetchers; force a re-query on demand
+            if st.button("🔄 Refresh Stats"):
+                clear_cached_data()
             
             if user_role == "Admin (You)":
-                doctors_count = len(get_doctors())
-                pharmacists_count = len(get_pharmacists())
-                pharmacies_count = len(get_pharmacies())
-                users_count = len(get_users())
+                (consultations_count, medications_count, doctors_count,
+                 pharmacists_count, pharmacies_count, users_count) = map(len, fetch_concurrently(
+                    lambda: get_all_consultations('id'), get_inventory, get_doctors,
+                    get_pharmacists, get_pharmacies, get_users
+                ))
                 
                 st.info(f"""
                 **Database Statistics:**
@@ -1878,6 +2417,10 @@ elif page == "⚙️ Settings":
                 - Status: ✅ Connected
                 """)
             else:
+                consultations_count, medications_count = map(len, fetch_concurrently(
+                    lambda: get_all_consultations('id'), get_inventory
+                ))
+                
                 st.info(f"""
                 **Database Statistics:**
                 - Consultations: {consultations_count}
@@ -1886,6 +2429,28 @@ elif page == "⚙️ Settings":
                 - Status: ✅ Connected
                 """)
 
+# ============================================================================
+# PAGE ROUTING
+# ============================================================================
+# Each page is its own fragment, so widget interactions inside a page only
+# rerun that page instead of the whole script (sidebar stats included).
+PAGE_RENDERERS = {
+    "📊 Live Queue": render_live_queue,
+    "👨‍⚕️ Doctors": render_doctors,
+    "💊 Pharmacists": render_pharmacists,
+    "🏪 Pharmacies": render_pharmacies,
+    "👥 Patients": render_patients,
+    "💰 Payments": render_payments,
+    "📈 Analytics": render_analytics,
+    "📦 Inventory": render_inventory,
+    "⚙️ Settings": render_settings,
+}
+
+if page == "📊 Live Queue" and st.session_state.get('queue_auto_refresh'):
+    render_live_queue_auto_refresh()
+else:
+    PAGE_RENDERERS[page]()
+
 # ============================================================================
 # FOOTER
 # ============================================================================
@@ -1922,10 +2487,41 @@ Plus updated Consultations table with:
 - platform_revenue
 - pharmacist_payout
 
+Index backing the Live Queue's server-side ORDER BY / LIMIT (get_consultations).
+The partial index covers the default view, which leaves out finished sessions:
+
+    CREATE INDEX consultations_queue_idx
+        ON "Consultations" (priority DESC NULLS LAST, created_at ASC);
+    CREATE INDEX consultations_open_queue_idx
+        ON "Consultations" (priority DESC NULLS LAST, created_at ASC)
+        WHERE completed_at IS NULL;
+
+REQUIRED: Consultations.response_time is set in the database when a provider
+acts on a session (the dashboard no longer sends it), so it uses the server
+clock. Without this trigger new rows keep response_time NULL, so Analytics "Avg
+Response Time" shows N/A and the provider response chart is empty.
+completed_at is still written by the dashboard (aware UTC) and doesn't need it:
+
+    CREATE OR REPLACE FUNCTION set_response_time() RETURNS trigger AS $$
+    BEGIN
+        NEW.response_time := now();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER consultations_set_response_time
+    BEFORE UPDATE OF status ON "Consultations"
+    FOR EACH ROW
+    WHEN (NEW.status IS DISTINCT FROM OLD.status
+          AND NEW.status IN ('confirmed', 'referred', 'referred_to_doctor',
+                             'referred_to_hospital', 'completed'))
+    EXECUTE FUNCTION set_response_time();
+
 SETUP:
 ------
 1. Update .streamlit/secrets.toml with Supabase credentials
-2. Run database migrations (SQL provided earlier)
+2. Run database migrations (SQL provided earlier), including the required
+   set_response_time trigger above
 3. Add sample doctors/pharmacists/pharmacies via dashboard
 4. Test end-to-end flow
 